@@ -2,19 +2,49 @@ from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from config import Config
 from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import sqlite3
 import os
 
 load_dotenv()
 
-db = SQLAlchemy()
+# Sob o worker gevent do gunicorn (que já aplicou o monkey patch), faz o psycopg2
+# ceder o loop enquanto espera o PostgreSQL, em vez de bloquear o worker inteiro.
+# Precisa rodar antes de qualquer conexão ser aberta.
+try:
+    from gevent import monkey
+    if monkey.is_module_patched('socket'):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+except ImportError:  # sem gevent, psycogreen ou psycopg2 (ex.: SQLite em dev)
+    pass
+
+# A sessão dura uma requisição; sem expire_on_commit, montar a resposta depois do
+# commit não dispara um novo SELECT para recarregar o objeto recém-gravado.
+db = SQLAlchemy(session_options={'expire_on_commit': False})
+
+# SQLite só aplica chaves estrangeiras (e o ON DELETE CASCADE) com este pragma ligado
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     db.init_app(app)
-    with app.app_context():
-        from models import user_model, patient_model, procedure_model, appointment_model
+    from models import user_model, patient_model, procedure_model, appointment_model
+
+    # O schema é criado uma única vez antes de subir o servidor (flask init-db), e não aqui:
+    # cada worker do gunicorn roda create_app() e, com o banco vazio, eles disputariam o CREATE TABLE.
+    @app.cli.command('init-db')
+    def init_db():
+        """Cria as tabelas que ainda não existem."""
         db.create_all()
+
     # register blueprints
     from routes.auth import auth_bp
     from routes.users import users_bp
@@ -36,5 +66,7 @@ def create_app():
 
 if __name__ == '__main__':
     app = create_app()
+    with app.app_context():
+        db.create_all()
     debug = os.getenv('FLASK_DEBUG', '1') == '1'
     app.run(host='0.0.0.0', port=5000, debug=debug)
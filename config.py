@@ -2,8 +2,25 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+def _engine_options(url):
+    # pool_pre_ping desligado: nada de SELECT 1 a cada checkout; conexões velhas são
+    # recicladas por idade. query_cache_size guarda mais SQL compilado entre requisições.
+    options = {'pool_pre_ping': False, 'query_cache_size': 1200}
+    if not url.startswith('sqlite'):
+        # SQLite usa um pool próprio (sem pool_size/max_overflow) e não tem conexões de rede.
+        # Por worker; somado entre os workers do gunicorn precisa caber no max_connections do banco.
+        options.update(
+            pool_recycle=1800,
+            pool_size=int(os.getenv('DB_POOL_SIZE', '20')),
+            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10'))
+        )
+    return options
+
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret')
     JWT_SECRET = os.getenv('JWT_SECRET', 'jwt-secret')
     SQLALCHEMY_DATABASE_URI = os.getenv('DB_URL', 'sqlite:///clinica.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
+    # Em dev/teste, faz qualquer lazy load não previsto nas listagens gerar erro (ver utils/pagination.py)
+    STRICT_LOADING = os.getenv('STRICT_LOADING', '0') == '1'
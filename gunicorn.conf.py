@@ -0,0 +1,15 @@
+import os
+from config import Config
+
+# Rotas são dominadas por I/O de banco: workers gevent atendem várias requisições
+# por processo enquanto outras aguardam o banco (o worker já aplica o monkey patch).
+worker_class = 'gevent'
+worker_connections = 2000
+bind = '0.0.0.0:5000'
+
+# Um worker por núcleo com PostgreSQL. Com SQLite (padrão do .env), um só: as escritas
+# num arquivo são serializadas e vários processos só disputariam o lock do banco.
+if Config.SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+    workers = 1
+else:
+    workers = len(os.sched_getaffinity(0))
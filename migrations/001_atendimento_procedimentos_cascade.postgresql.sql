@@ -0,0 +1,10 @@
+-- Vínculos atendimento -> procedimento passam a ser apagados pelo banco junto com o
+-- atendimento (ON DELETE CASCADE). Necessário para bancos criados antes dessa mudança:
+-- o db.create_all() não altera tabelas existentes e o ORM não apaga mais os vínculos.
+BEGIN;
+ALTER TABLE atendimento_procedimentos
+    DROP CONSTRAINT IF EXISTS atendimento_procedimentos_atendimento_id_fkey;
+ALTER TABLE atendimento_procedimentos
+    ADD CONSTRAINT atendimento_procedimentos_atendimento_id_fkey
+    FOREIGN KEY (atendimento_id) REFERENCES atendimentos (id) ON DELETE CASCADE;
+COMMIT;
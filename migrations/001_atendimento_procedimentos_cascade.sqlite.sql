@@ -0,0 +1,19 @@
+-- Mesma mudança da versão PostgreSQL. O SQLite não altera FKs de tabelas existentes,
+-- então a tabela é recriada mantendo as linhas (ids inclusive).
+-- Uso: sqlite3 instance/clinica.db < migrations/001_atendimento_procedimentos_cascade.sqlite.sql
+PRAGMA foreign_keys=OFF;
+BEGIN;
+CREATE TABLE atendimento_procedimentos_new (
+	id INTEGER NOT NULL,
+	atendimento_id INTEGER NOT NULL,
+	procedimento_id INTEGER NOT NULL,
+	PRIMARY KEY (id),
+	FOREIGN KEY(atendimento_id) REFERENCES atendimentos (id) ON DELETE CASCADE,
+	FOREIGN KEY(procedimento_id) REFERENCES procedimentos (id)
+);
+INSERT INTO atendimento_procedimentos_new (id, atendimento_id, procedimento_id)
+    SELECT id, atendimento_id, procedimento_id FROM atendimento_procedimentos;
+DROP TABLE atendimento_procedimentos;
+ALTER TABLE atendimento_procedimentos_new RENAME TO atendimento_procedimentos;
+COMMIT;
+PRAGMA foreign_keys=ON;
@@ -4,7 +4,8 @@ from datetime import datetime
 class AppointmentProcedure(db.Model):
     __tablename__ = 'atendimento_procedimentos'
     id = db.Column(db.Integer, primary_key=True)
-    atendimento_id = db.Column(db.Integer, db.ForeignKey('atendimentos.id'), nullable=False)
+    # Os vínculos são removidos pelo próprio banco quando o atendimento é excluído
+    atendimento_id = db.Column(db.Integer, db.ForeignKey('atendimentos.id', ondelete='CASCADE'), nullable=False)
     procedimento_id = db.Column(db.Integer, db.ForeignKey('procedimentos.id'), nullable=False)
 
 class Appointment(db.Model):
@@ -18,7 +19,8 @@ class Appointment(db.Model):
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     paciente_id = db.Column(db.Integer, db.ForeignKey('pacientes.id'), nullable=False)
 
-    procedimentos = db.relationship('AppointmentProcedure', backref='atendimento', lazy=True)
+    # passive_deletes: deixa o ON DELETE CASCADE do banco apagar os vínculos (sem SELECT/DELETE extra)
+    procedimentos = db.relationship('AppointmentProcedure', backref='atendimento', lazy=True, passive_deletes=True)
 
     def to_dict(self):
         return {
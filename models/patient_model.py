@@ -1,5 +1,11 @@
 from app import db
-from datetime import datetime
+from datetime import date
+
+def is_minor(birth, today=None):
+    """True se quem nasceu em `birth` ainda não fez 18 anos em `today` (padrão: hoje)."""
+    t = today or date.today()
+    # Compara (ano, mês, dia) direto: correto em anos bissextos e sem criar timedelta
+    return (t.year, t.month, t.day) < (birth.year + 18, birth.month, birth.day)
 
 class Patient(db.Model):
     __tablename__ = 'pacientes'
@@ -23,19 +29,17 @@ class Patient(db.Model):
     resp_email = db.Column(db.String(150), nullable=True)
     resp_telefone = db.Column(db.String(30), nullable=True)
 
-    atendimentos = db.relationship('Appointment', backref='paciente', lazy=True)
+    # passive_deletes: delete_patient só remove pacientes sem atendimentos (checado antes),
+    # então a sessão não precisa carregar a coleção antes do DELETE
+    atendimentos = db.relationship('Appointment', backref='paciente', lazy=True, passive_deletes=True)
 
     def is_minor(self):
-        today = datetime.today().date()
-        age = (today - self.data_nascimento).days // 365
-        return age < 18
+        return is_minor(self.data_nascimento)
 
     def responsible_is_adult(self):
         if not self.resp_data_nascimento:
             return False
-        today = datetime.today().date()
-        age = (today - self.resp_data_nascimento).days // 365
-        return age >= 18
+        return not is_minor(self.resp_data_nascimento)
 
     def to_dict(self):
         data = {
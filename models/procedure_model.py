@@ -8,7 +8,9 @@ class Procedure(db.Model):
     valor_plano = db.Column(db.Float, nullable=False)
     valor_particular = db.Column(db.Float, nullable=False)
 
-    itens = db.relationship('AppointmentProcedure', backref='procedimento', lazy=True)
+    # passive_deletes: delete_procedure só remove procedimentos sem vínculos (checado antes),
+    # então a sessão não precisa carregar a coleção antes do DELETE
+    itens = db.relationship('AppointmentProcedure', backref='procedimento', lazy=True, passive_deletes=True)
 
     def to_dict(self):
         return {
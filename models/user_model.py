@@ -1,5 +1,38 @@
 from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+
+# argon2id com os parâmetros mínimos da OWASP (~35 ms por hash/verificação, contra
+# ~300 ms do pbkdf2 de 600k iterações do werkzeug). Para reajustar, medir com
+# timeit no hardware de produção e mirar ~50 ms.
+PASSWORD_HASHER = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+try:
+    from gevent import get_hub
+    from gevent.monkey import is_module_patched
+except ImportError:  # gevent só é necessário no deploy (gunicorn -k gevent)
+    get_hub = None
+
+def _under_gevent():
+    return get_hub is not None and is_module_patched('threading')
+
+def _run_kdf(fn, *args):
+    """O KDF segura a CPU por dezenas de ms. Sob o worker gevent, roda numa thread real
+    do threadpool do hub (argon2 e hashlib liberam o GIL), sem parar os outros greenlets."""
+    if _under_gevent():
+        return get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+def hash_password(senha):
+    return _run_kdf(PASSWORD_HASHER.hash, senha)
+
+def hash_passwords(senhas):
+    """Hashes de várias senhas, na mesma ordem. Sob o worker gevent, em paralelo nas
+    threads do threadpool do hub (que liberam o GIL durante o argon2)."""
+    if _under_gevent():
+        return list(get_hub().threadpool.imap(PASSWORD_HASHER.hash, senhas))
+    return [PASSWORD_HASHER.hash(senha) for senha in senhas]
 
 class User(db.Model):
     __tablename__ = 'usuarios'
@@ -10,13 +43,29 @@ class User(db.Model):
     tipo = db.Column(db.String(20), nullable=False)  # admin ou default
     senha_hash = db.Column(db.String(255), nullable=False)
 
-    atendimentos = db.relationship('Appointment', backref='usuario', lazy=True)
+    # passive_deletes: delete_user só remove usuários sem atendimentos (checado na mesma
+    # consulta), então a sessão não precisa carregar a coleção antes do DELETE
+    atendimentos = db.relationship('Appointment', backref='usuario', lazy=True, passive_deletes=True)
 
     def set_password(self, senha):
-        self.senha_hash = generate_password_hash(senha)
+        self.senha_hash = hash_password(senha)
 
-    def check_password(self, senha):
-        return check_password_hash(self.senha_hash, senha)
+    def check_password(self, senha, rehash=True):
+        """Confere a senha. Hashes antigos do werkzeug, ou argon2 com parâmetros
+        desatualizados, são regravados no objeto; quem chama decide o commit.
+        rehash=False pula essa regravação (ex.: quando a senha vai ser trocada em seguida)."""
+        if not self.senha_hash.startswith('$argon2'):
+            ok = _run_kdf(check_password_hash, self.senha_hash, senha)
+            if ok and rehash:
+                self.set_password(senha)
+            return ok
+        try:
+            _run_kdf(PASSWORD_HASHER.verify, self.senha_hash, senha)
+        except (VerificationError, InvalidHashError):
+            return False
+        if rehash and PASSWORD_HASHER.check_needs_rehash(self.senha_hash):
+            self.set_password(senha)
+        return True
 
     def to_dict(self):
         return {
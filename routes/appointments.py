@@ -1,20 +1,39 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, abort
 from app import db
 from models.appointment_model import Appointment, AppointmentProcedure
-from models.procedure_model import Procedure
 from models.patient_model import Patient
+from models.procedure_model import Procedure
 from models.user_model import User
 from utils.jwt_util import auth_required
-from utils.pagination import paginate_query
-from datetime import datetime
+from utils.validation import clean_str, parse_iso_datetime
+from utils.pagination import paginate_query, projectable_fields, select_fields
+from sqlalchemy.exc import IntegrityError
+from utils.json_util import msgjsonify, get_json_fast, write_response
+from schemas import AppointmentOut, CreateAppointmentReq
+from sqlalchemy import func, case, exists
+from sqlalchemy.orm import selectinload
+from collections import Counter
+import msgspec
 
 appointments_bp = Blueprint('appointments_bp', __name__)
 
-# Função auxiliar para verificar se a string não está vazia (após strip).
-# Reutilizada de outros arquivos para consistência.
-def is_valid_string(value):
-    """Retorna True se o valor for uma string não vazia (após strip), False caso contrário."""
-    return isinstance(value, str) and bool(value.strip())
+_VALID_TIPOS = frozenset(('plano', 'particular'))
+
+# Carrega os procedimentos vinculados em uma única consulta extra (evita N+1 no to_dict)
+_LOAD_PROCEDIMENTOS = selectinload(Appointment.procedimentos).joinedload(AppointmentProcedure.procedimento)
+
+def with_procedimentos(query):
+    return query.options(_LOAD_PROCEDIMENTOS)
+
+# colunas que podem ser pedidas em ?fields= nas listagens (procedimentos fica de fora)
+_LIST_FIELDS = projectable_fields(Appointment, AppointmentOut)
+
+def list_query(cursor_cols):
+    """Query base das listagens e seu serializador: só as colunas de ?fields=, ou o DTO completo."""
+    query, serialize = select_fields(Appointment.query, Appointment, _LIST_FIELDS, cursor_cols)
+    if serialize is None:
+        return with_procedimentos(query), AppointmentOut.from_model
+    return query, serialize
 
 def calc_valor_total(proc_objs, tipo):
     total = 0.0
@@ -26,107 +45,121 @@ def calc_valor_total(proc_objs, tipo):
             total += p.valor_particular
     return total
 
+def sum_procedimentos(ids, tipo, *extra_cols):
+    """Retorna (nº de IDs distintos existentes, soma dos valores, *extra_cols) calculados no banco,
+    numa única consulta. extra_cols são expressões escalares (ex.: exists()) avaliadas no mesmo SELECT."""
+    counts = Counter(ids)
+    valor = Procedure.valor_plano if tipo == 'plano' else Procedure.valor_particular
+    # IDs repetidos na lista contam uma vez para cada ocorrência
+    peso = case(counts, value=Procedure.id, else_=0)
+    found, total, *extra = db.session.query(
+        func.count(Procedure.id), func.sum(valor * peso), *extra_cols
+    ).filter(Procedure.id.in_(counts)).one()
+    return (found, float(total or 0), *extra)
+
+def missing_procedimento_id(ids):
+    """Primeiro ID da lista que não existe, ou None (usado só no caminho de erro)."""
+    existing = {pid for (pid,) in db.session.query(Procedure.id).filter(Procedure.id.in_(ids))}
+    return next((i for i in ids if i not in existing), None)
+
 @appointments_bp.route('/', methods=['POST'])
 @auth_required
 def create_appointment():
-    data = request.get_json() or {}
-    
-    # Campos que precisam estar presentes, mas que serão validados individualmente
-    required_keys = ['data_hora','paciente_id','procedimentos','tipo']
-    
-    # Validação básica de presença
-    for f in required_keys:
-        if data.get(f) is None:
-            return jsonify({'erro':f'Campo {f} obrigatório'}), 400
-            
-    # Validação de tipo (string não vazia)
-    tipo = data['tipo']
-    if not is_valid_string(tipo) or tipo not in ['plano','particular']:
-        return jsonify({'erro':'tipo deve ser "plano" ou "particular" e não pode ser vazio'}), 400
+    # Presença e tipos de data_hora, paciente_id, procedimentos e tipo são validados pelo msgspec
+    try:
+        req = msgspec.json.decode(request.get_data(), type=CreateAppointmentReq, strict=False)
+    except msgspec.DecodeError as e:
+        return jsonify({'erro':f'Dados inválidos: {e}'}), 400
+    tipo = req.tipo
     
     # parse date
     try:
-        data_hora = datetime.fromisoformat(data['data_hora'])
+        data_hora = parse_iso_datetime(req.data_hora)
     except Exception:
         return jsonify({'erro':'data_hora formato ISO (YYYY-MM-DDTHH:MM:SS) esperado'}), 400
         
-    # Validação do paciente
-    paciente = Patient.query.get(data['paciente_id'])
-    if not paciente:
-        return jsonify({'erro':'Paciente não encontrado'}), 404
-        
     # Validação de procedimentos
-    proc_ids = data['procedimentos']
-    if not isinstance(proc_ids, list) or len(proc_ids)==0:
+    int_ids = req.procedimentos
+    if len(int_ids)==0:
         return jsonify({'erro':'Deve existir pelo menos um procedimento associado'}), 400
-        
-    proc_objs = []
-    for pid in proc_ids:
-        # Garante que o ID do procedimento seja um número inteiro (Flask/JSON podem retornar strings)
-        try:
-            pid = int(pid)
-        except (ValueError, TypeError):
-            return jsonify({'erro':f'ID de procedimento inválido: {pid}'}), 400
-            
-        p = Procedure.query.get(pid)
-        if not p:
-            return jsonify({'erro':f'Procedimento id {pid} não encontrado'}), 404
-        proc_objs.append(p)
+
+    # Paciente, existência dos procedimentos e valor total numa única consulta agregada
+    # (uma só ida ao banco antes do INSERT, sem carregar paciente nem procedimentos)
+    paciente_id = req.paciente_id
+    found, valor_total, paciente_existe = sum_procedimentos(
+        int_ids, tipo, exists().where(Patient.id == paciente_id)
+    )
+    if not paciente_existe:
+        return jsonify({'erro':'Paciente não encontrado'}), 404
+    if found != len(set(int_ids)):
+        return jsonify({'erro':f'Procedimento id {missing_procedimento_id(int_ids)} não encontrado'}), 404
 
     # Validação de numero_carteira para tipo plano
     if tipo == 'plano':
-        numero_carteira = data.get('numero_carteira')
-        if not is_valid_string(numero_carteira):
+        numero_carteira_cleaned = clean_str(req.numero_carteira)
+        if not numero_carteira_cleaned:
              return jsonify({'erro':'numero_carteira obrigatório e não pode ser vazio para tipo plano'}), 400
-        numero_carteira_cleaned = numero_carteira.strip()
     else:
         numero_carteira_cleaned = None
 
     # create appointment
     usuario_id = request.user.get('id')
-    valor_total = calc_valor_total(proc_objs, tipo)
     
     ap = Appointment(
         data_hora=data_hora,
-        tipo=tipo.strip(),
+        tipo=tipo,
         numero_carteira=numero_carteira_cleaned,
         valor_total=valor_total,
         usuario_id=usuario_id,
-        paciente_id=paciente.id
+        paciente_id=paciente_id
     )
     
     db.session.add(ap)
     db.session.flush()  # get id
     
-    for p in proc_objs:
-        ap_proc = AppointmentProcedure(atendimento_id=ap.id, procedimento_id=p.id)
-        db.session.add(ap_proc)
-        
-    db.session.commit()
-    return jsonify(ap.to_dict()), 201
+    # Um único INSERT multi-linha para os vínculos (na ordem enviada pelo cliente).
+    # Um procedimento removido depois da consulta de preços viola a FK: vira 404.
+    try:
+        db.session.bulk_insert_mappings(AppointmentProcedure, [
+            {'atendimento_id': ap.id, 'procedimento_id': pid} for pid in int_ids
+        ])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        missing = missing_procedimento_id(int_ids)
+        if missing is None:
+            raise
+        return jsonify({'erro':f'Procedimento id {missing} não encontrado'}), 404
+    return write_response(ap, 201)
 
 @appointments_bp.route('/<int:ap_id>', methods=['GET'])
 @auth_required
 def get_appointment(ap_id):
-    ap = Appointment.query.get_or_404(ap_id)
-    return jsonify(ap.to_dict()), 200
+    ap = db.session.get(Appointment, ap_id, options=[_LOAD_PROCEDIMENTOS])
+    if ap is None:
+        abort(404)
+    return msgjsonify(AppointmentOut.from_model(ap)), 200
 
 @appointments_bp.route('/', methods=['GET'])
 @auth_required
 def list_appointments():
-    query = Appointment.query.order_by(Appointment.id)
-    return jsonify(paginate_query(query, lambda a: a.to_dict())), 200
+    cursor_cols = (Appointment.id,)
+    query, serialize = list_query(cursor_cols)
+    query = query.order_by(Appointment.id)
+    return msgjsonify(paginate_query(query, serialize, cursor_cols=cursor_cols)), 200
 
 @appointments_bp.route('/<int:ap_id>', methods=['PUT'])
 @auth_required
 def update_appointment(ap_id):
-    ap = Appointment.query.get_or_404(ap_id)
+    ap = db.session.get(Appointment, ap_id, options=[_LOAD_PROCEDIMENTOS])
+    if ap is None:
+        abort(404)
     
     # only creator or admin can edit
     if request.user.get('tipo') != 'admin' and request.user.get('id') != ap.usuario_id:
         return jsonify({'erro':'Apenas criador ou admin pode editar atendimento'}), 403
         
-    data = request.get_json() or {}
+    data = get_json_fast()
     
     # Variável para rastrear se os procedimentos foram alterados, o que afeta o valor total
     procedimentos_changed = False 
@@ -134,91 +167,92 @@ def update_appointment(ap_id):
     # Atualiza data_hora
     if data.get('data_hora'):
         # Validação de string não vazia (embora data_hora deva ser string)
-        if not is_valid_string(data['data_hora']):
+        data_hora = clean_str(data['data_hora'])
+        if not data_hora:
             return jsonify({'erro':'data_hora não pode ser vazio'}), 400
         try:
-            ap.data_hora = datetime.fromisoformat(data['data_hora'].strip())
+            ap.data_hora = parse_iso_datetime(data_hora)
         except:
             return jsonify({'erro':'data_hora formato ISO (YYYY-MM-DDTHH:MM:SS) esperado'}), 400
             
     # Atualiza paciente
     if data.get('paciente_id'):
-        p = Patient.query.get(data['paciente_id'])
+        p = db.session.get(Patient, data['paciente_id'])
         if not p:
             return jsonify({'erro':'Paciente não encontrado'}), 404
         ap.paciente_id = p.id
         
+    # Atualiza tipo (antes dos procedimentos, pois o valor total depende dele)
+    if data.get('tipo'):
+        tipo = clean_str(data['tipo'])
+        if tipo not in _VALID_TIPOS:
+            return jsonify({'erro':'tipo deve ser "plano" ou "particular" e não pode ser vazio'}), 400
+        ap.tipo = tipo
+        
     # Atualiza procedimentos
     if data.get('procedimentos') is not None:
         proc_ids = data['procedimentos']
         if not isinstance(proc_ids, list) or len(proc_ids)==0:
             return jsonify({'erro':'Deve existir pelo menos um procedimento associado'}), 400
             
-        # remove old links
-        AppointmentProcedure.query.filter_by(atendimento_id=ap.id).delete()
-        proc_objs = []
+        int_ids = []
         for pid in proc_ids:
             try:
-                pid = int(pid)
+                int_ids.append(int(pid))
             except (ValueError, TypeError):
                 return jsonify({'erro':f'ID de procedimento inválido: {pid}'}), 400
-                
-            p = Procedure.query.get(pid)
-            if not p:
-                return jsonify({'erro':f'Procedimento id {pid} não encontrado'}), 404
-            proc_objs.append(p)
-            
-            ap_proc = AppointmentProcedure(atendimento_id=ap.id, procedimento_id=p.id)
-            db.session.add(ap_proc)
-            
-        # Marca para recálculo do valor total
+
+        found, valor_total = sum_procedimentos(int_ids, ap.tipo)
+        if found != len(set(int_ids)):
+            return jsonify({'erro':f'Procedimento id {missing_procedimento_id(int_ids)} não encontrado'}), 404
+
+        # remove old links
+        AppointmentProcedure.query.filter_by(atendimento_id=ap.id).delete()
+        try:
+            db.session.bulk_insert_mappings(AppointmentProcedure, [
+                {'atendimento_id': ap.id, 'procedimento_id': pid} for pid in int_ids
+            ])
+        except IntegrityError:
+            # procedimento removido depois da consulta de preços (FK)
+            db.session.rollback()
+            missing = missing_procedimento_id(int_ids)
+            if missing is None:
+                raise
+            return jsonify({'erro':f'Procedimento id {missing} não encontrado'}), 404
+        ap.valor_total = valor_total
+        # a lista carregada ficou desatualizada (a sessão não expira no commit)
+        db.session.expire(ap, ['procedimentos'])
         procedimentos_changed = True
         
-    # Atualiza tipo
-    if data.get('tipo'):
-        tipo = data['tipo']
-        if not is_valid_string(tipo) or tipo not in ['plano','particular']:
-            return jsonify({'erro':'tipo deve ser "plano" ou "particular" e não pode ser vazio'}), 400
-        ap.tipo = tipo.strip()
-        
     # Atualiza numero_carteira
     if data.get('numero_carteira') is not None:
-        numero_carteira = data['numero_carteira']
-        # Se for fornecido, deve ser string válida
-        if not is_valid_string(numero_carteira):
-            # Se for fornecido mas estiver vazio, limpa o campo
-            ap.numero_carteira = None 
-        else:
-            ap.numero_carteira = numero_carteira.strip()
+        # Se for fornecido mas estiver vazio (ou não for string), limpa o campo
+        ap.numero_carteira = clean_str(data['numero_carteira'])
 
     # Se o tipo é plano (após possíveis atualizações), o numero_carteira é obrigatório
     if ap.tipo == 'plano' and not ap.numero_carteira:
         return jsonify({'erro':'numero_carteira obrigatório para tipo plano'}), 400
         
-    # Recalcula valor total se procedimentos ou tipo mudaram (ou se for o primeiro update de tipo)
-    if procedimentos_changed or 'tipo' in data:
-        # Se os procedimentos não foram atualizados explicitamente, carrega os atuais
-        if not procedimentos_changed:
-            proc_objs = [ap_proc.procedimento for ap_proc in ap.procedimentos_vinculados]
-            
-        # Recalcula com o tipo atualizado
+    # Se só o tipo mudou, recalcula com os procedimentos atuais (já carregados junto com o atendimento)
+    if 'tipo' in data and not procedimentos_changed:
+        proc_objs = [ap_proc.procedimento for ap_proc in ap.procedimentos]
         ap.valor_total = calc_valor_total(proc_objs, ap.tipo)
         
     db.session.commit()
-    return jsonify(ap.to_dict()), 200
+    return write_response(ap, 200)
 
 @appointments_bp.route('/<int:ap_id>', methods=['DELETE'])
 @auth_required
 def delete_appointment(ap_id):
-    ap = Appointment.query.get_or_404(ap_id)
+    ap = db.session.get(Appointment, ap_id)
+    if ap is None:
+        abort(404)
     
     # only creator or admin
     if request.user.get('tipo') != 'admin' and request.user.get('id') != ap.usuario_id:
         return jsonify({'erro':'Apenas criador ou admin pode remover atendimento'}), 403
         
-    # delete linked procedures then appointment
-    from models.appointment_model import AppointmentProcedure
-    AppointmentProcedure.query.filter_by(atendimento_id=ap.id).delete()
+    # linked procedures are removed by the ON DELETE CASCADE on atendimento_id
     db.session.delete(ap)
     db.session.commit()
     return jsonify({'mensagem':'Atendimento removido'}), 200
@@ -227,20 +261,17 @@ def delete_appointment(ap_id):
 @auth_required
 def list_between_dates():
     # expects ?start=YYYY-MM-DD&end=YYYY-MM-DD
-    start = request.args.get('start')
-    end = request.args.get('end')
+    start_cleaned = clean_str(request.args.get('start'))
+    end_cleaned = clean_str(request.args.get('end'))
     
     # Validação de string não vazia para os argumentos de URL
-    if not is_valid_string(start) or not is_valid_string(end):
+    if not start_cleaned or not end_cleaned:
         return jsonify({'erro':'Parâmetros start e end obrigatórios e não podem ser vazios'}), 400
-        
-    start_cleaned = start.strip()
-    end_cleaned = end.strip()
     
     try:
-        # Usamos fromisoformat que pode aceitar YYYY-MM-DD ou YYYY-MM-DDTHH:MM:SS
-        s = datetime.fromisoformat(start_cleaned)
-        e = datetime.fromisoformat(end_cleaned)
+        # parse_iso_datetime (ciso8601, em C) aceita YYYY-MM-DD ou YYYY-MM-DDTHH:MM:SS
+        s = parse_iso_datetime(start_cleaned)
+        e = parse_iso_datetime(end_cleaned)
         
         # Se o formato for apenas YYYY-MM-DD, é bom garantir que 'end' seja no final do dia
         if len(end_cleaned) == 10:
@@ -249,5 +280,7 @@ def list_between_dates():
     except:
         return jsonify({'erro':'Formato de data inválido, use ISO (YYYY-MM-DD ou YYYY-MM-DDTHH:MM:SS)'}), 400
         
-    query = Appointment.query.filter(Appointment.data_hora >= s, Appointment.data_hora <= e).order_by(Appointment.data_hora)
-    return jsonify(paginate_query(query, lambda a: a.to_dict())), 200
\ No newline at end of file
+    cursor_cols = (Appointment.data_hora, Appointment.id)
+    query, serialize = list_query(cursor_cols)
+    query = query.filter(Appointment.data_hora >= s, Appointment.data_hora <= e).order_by(Appointment.data_hora, Appointment.id)
+    return msgjsonify(paginate_query(query, serialize, cursor_cols=cursor_cols)), 200
\ No newline at end of file
@@ -1,68 +1,65 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, jsonify
 from app import db
 from models.user_model import User
+from utils.json_util import get_json_fast
 from utils.jwt_util import generate_token
+from utils.validation import clean_str
 from datetime import datetime
 
 auth_bp = Blueprint('auth_bp', __name__)
 
-# Função auxiliar para verificar se a string não está vazia (após strip).
-# Reutilizada de outros arquivos para consistência.
-def is_valid_string(value):
-    """Retorna True se o valor for uma string não vazia (após strip), False caso contrário."""
-    return isinstance(value, str) and bool(value.strip())
+# Constantes de validação (montadas uma vez, não a cada requisição)
+_VALID_USER_TIPOS = frozenset(('admin', 'default'))
+
+# Campos obrigatórios para o registro
+_REQUIRED_REGISTER_FIELDS = {
+    'email': 'Email',
+    'nome': 'Nome',
+    'tipo': 'Tipo',
+    'senha': 'Senha'
+}
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
-    data = request.get_json() or {}
-    email = data.get('email')
+    data = get_json_fast()
+    email_cleaned = clean_str(data.get('email'))
     senha = data.get('senha')
     
     # Validação de não-vazio
-    if not is_valid_string(email) or not is_valid_string(senha):
+    if not email_cleaned or not clean_str(senha):
         return jsonify({'erro':'Email e senha são obrigatórios e não podem ser vazios'}), 400
-        
-    email_cleaned = email.strip()
     
     user = User.query.filter_by(email=email_cleaned).first()
     
     # Validação de credenciais
     if not user or not user.check_password(senha):
         return jsonify({'erro':'Credenciais inválidas'}), 401
+    # check_password pode ter migrado um hash antigo para argon2
+    if db.session.is_modified(user):
+        db.session.commit()
         
     token = generate_token(user.id, user.tipo)
     return jsonify({'token': token, 'usuario': user.to_dict()}), 200
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
-    data = request.get_json() or {}
+    data = get_json_fast()
 
-    email = data.get('email')
-    nome = data.get('nome')
-    tipo = data.get('tipo', 'default')  # default se não enviar
     senha = data.get('senha')
 
-    # Campos obrigatórios para o registro
-    required_fields = {
-        'email': 'Email',
-        'nome': 'Nome',
-        'tipo': 'Tipo',
-        'senha': 'Senha'
-    }
-
-    # Validação de campos obrigatórios e não vazios
-    for field, display_name in required_fields.items():
-        value = data.get(field)
-        if not is_valid_string(value):
+    # Validação de campos obrigatórios e não vazios (clean_str já aplica o strip)
+    cleaned = {}
+    for field, display_name in _REQUIRED_REGISTER_FIELDS.items():
+        cleaned[field] = clean_str(data.get(field))
+        if not cleaned[field]:
             return jsonify({'erro': f'O campo {display_name} é obrigatório e não pode ser vazio'}), 400
 
-    # Aplica strip nas strings
-    email_cleaned = email.strip()
-    nome_cleaned = nome.strip()
-    tipo_cleaned = tipo.strip()
+    email_cleaned = cleaned['email']
+    nome_cleaned = cleaned['nome']
+    tipo_cleaned = cleaned['tipo']
     
     # Validação de tipo
-    if tipo_cleaned not in ['admin', 'default']:
+    if tipo_cleaned not in _VALID_USER_TIPOS:
         return jsonify({'erro': 'Tipo inválido (use admin ou default)'}), 400
 
     # check se email já existe
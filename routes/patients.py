@@ -1,58 +1,74 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, jsonify, abort
 from app import db
-from models.patient_model import Patient
+from models.patient_model import Patient, is_minor
 from utils.jwt_util import auth_required
-from utils.pagination import paginate_query
-from datetime import datetime, date # Importado date explicitamente
+from utils.validation import clean_str, parse_iso_datetime
+from utils.pagination import paginate_query, projectable_fields, select_fields
+from utils.json_util import msgjsonify, get_json_fast, write_response
+from schemas import PatientOut
+from utils.db_errors import unique_violation_field
+from sqlalchemy.exc import IntegrityError
+from datetime import date # Importado date explicitamente
 
 patients_bp = Blueprint('patients_bp', __name__)
 
-# Função auxiliar para verificar se a string não está vazia (após strip).
-# Reutilizada de outros arquivos para consistência.
-def is_valid_string(value):
-    """Retorna True se o valor for uma string não vazia (após strip), False caso contrário."""
-    return isinstance(value, str) and bool(value.strip())
+# Todos os campos obrigatórios (incluindo strings)
+_REQUIRED_PATIENT_FIELDS = {
+    'cpf': 'CPF',
+    'nome': 'Nome',
+    'email': 'Email',
+    'telefone': 'Telefone',
+    'data_nascimento': 'Data de Nascimento',
+    'estado': 'Estado',
+    'cidade': 'Cidade',
+    'bairro': 'Bairro',
+    'cep': 'CEP',
+    'rua': 'Rua',
+    'numero': 'Número'
+}
+
+# Campos do responsável, obrigatórios para paciente menor
+_REQUIRED_RESP_FIELDS = {
+    'resp_cpf': 'CPF do Responsável',
+    'resp_nome': 'Nome do Responsável',
+    'resp_data_nascimento': 'Data de Nascimento do Responsável',
+    'resp_email': 'Email do Responsável',
+    'resp_telefone': 'Telefone do Responsável'
+}
+
+# Campos de string que, se fornecidos no PUT, não podem ser vazios.
+_UPDATABLE_STRING_FIELDS = ('cpf', 'nome', 'email', 'telefone', 'estado', 'cidade', 'bairro', 'cep', 'rua', 'numero')
+
+# Colunas que podem ser pedidas em ?fields= na listagem (endereco/responsavel ficam de fora)
+_LIST_FIELDS = projectable_fields(Patient, PatientOut)
 
 def parse_date(date_str):
-    return datetime.fromisoformat(date_str).date()
+    return parse_iso_datetime(date_str).date()
+
+def duplicate_patient_error(err):
+    """Mensagem de erro para um IntegrityError de CPF/Email duplicado (None se for outra violação)."""
+    field = unique_violation_field(err, ('cpf', 'email'))
+    if field == 'cpf':
+        return 'CPF já cadastrado'
+    if field == 'email':
+        return 'Email já cadastrado'
+    return None
 
 @patients_bp.route('/', methods=['POST'])
 @auth_required
 def create_patient():
-    data = request.get_json() or {}
+    data = get_json_fast()
+    
+    # Remove espaços em branco das strings (só com espaços vira None)
+    data_cleaned = {k: clean_str(v) if isinstance(v, str) else v for k, v in data.items()}
     
-    # Todos os campos obrigatórios (incluindo strings)
-    required_fields = {
-        'cpf': 'CPF',
-        'nome': 'Nome',
-        'email': 'Email',
-        'telefone': 'Telefone',
-        'data_nascimento': 'Data de Nascimento',
-        'estado': 'Estado',
-        'cidade': 'Cidade',
-        'bairro': 'Bairro',
-        'cep': 'CEP',
-        'rua': 'Rua',
-        'numero': 'Número'
-    }
-
     # Validação de campos obrigatórios e não vazios
-    for field, display_name in required_fields.items():
-        value = data.get(field)
+    for field, display_name in _REQUIRED_PATIENT_FIELDS.items():
         # Verifica se o campo está ausente OU se é uma string vazia/só com espaços
-        if not value or (isinstance(value, str) and not is_valid_string(value)):
+        if not data_cleaned.get(field):
             return jsonify({'erro':f'Campo {display_name} obrigatório e não pode ser vazio'}), 400
             
-    # Remove espaços em branco das strings que serão usadas
-    data_cleaned = {k: v.strip() if isinstance(v, str) else v for k, v in data.items()}
-    
-    # check duplicates (usando os valores limpos)
-    if Patient.query.filter_by(cpf=data_cleaned['cpf']).first():
-        return jsonify({'erro':'CPF já cadastrado'}), 400
-    if Patient.query.filter_by(email=data_cleaned['email']).first():
-        return jsonify({'erro':'Email já cadastrado'}), 400
-        
-    # create
+    # create (duplicidade de CPF/Email é verificada pelas restrições UNIQUE no commit)
     try:
         pn = parse_date(data_cleaned['data_nascimento'])
     except Exception:
@@ -73,99 +89,79 @@ def create_patient():
     )
     
     # if minor, responsible data required
-    age = (date.today() - pn).days//365
-    if age < 18:
-        rfields = {
-            'resp_cpf': 'CPF do Responsável',
-            'resp_nome': 'Nome do Responsável',
-            'resp_data_nascimento': 'Data de Nascimento do Responsável',
-            'resp_email': 'Email do Responsável',
-            'resp_telefone': 'Telefone do Responsável'
-        }
-        for f, display_name in rfields.items():
-            value = data.get(f)
+    today = date.today()
+    if is_minor(pn, today):
+        for f, display_name in _REQUIRED_RESP_FIELDS.items():
             # Validação de campo obrigatório e não vazio para responsável
-            if not value or (isinstance(value, str) and not is_valid_string(value)):
+            if not data_cleaned.get(f):
                 return jsonify({'erro':f'Paciente menor: campo {display_name} obrigatório e não pode ser vazio'}), 400
-        
-        # Remove espaços em branco dos dados do responsável
-        resp_data_cleaned = {k: v.strip() for k, v in data.items() if k in rfields}
 
         try:
-            rd = parse_date(resp_data_cleaned['resp_data_nascimento'])
+            rd = parse_date(data_cleaned['resp_data_nascimento'])
         except Exception:
             return jsonify({'erro':'resp_data_nascimento formato ISO (YYYY-MM-DD) esperado'}), 400
             
         # responsible cannot be minor
-        r_age = (date.today() - rd).days//365
-        if r_age < 18:
+        if is_minor(rd, today):
             return jsonify({'erro':'Responsável não pode ser menor de idade'}), 400
             
-        patient.resp_cpf = resp_data_cleaned['resp_cpf']
-        patient.resp_nome = resp_data_cleaned['resp_nome']
+        patient.resp_cpf = data_cleaned['resp_cpf']
+        patient.resp_nome = data_cleaned['resp_nome']
         patient.resp_data_nascimento = rd
-        patient.resp_email = resp_data_cleaned['resp_email']
-        patient.resp_telefone = resp_data_cleaned['resp_telefone']
+        patient.resp_email = data_cleaned['resp_email']
+        patient.resp_telefone = data_cleaned['resp_telefone']
         
     db.session.add(patient)
-    db.session.commit()
-    return jsonify(patient.to_dict()), 201
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        erro = duplicate_patient_error(e)
+        if erro is None:
+            raise
+        return jsonify({'erro': erro}), 400
+    return write_response(patient, 201)
 
 @patients_bp.route('/<int:patient_id>', methods=['PUT'])
 @auth_required
 def update_patient(patient_id):
-    data = request.get_json() or {}
-    patient = Patient.query.get_or_404(patient_id)
-    
-    # Campos de string que, se fornecidos, não podem ser vazios.
-    string_fields = ['cpf', 'nome', 'email', 'telefone', 'estado', 'cidade', 'bairro', 'cep', 'rua', 'numero']
+    data = get_json_fast()
+    patient = db.session.get(Patient, patient_id)
+    if patient is None:
+        abort(404)
     
     # Processa e valida todos os campos de string
-    for field in string_fields:
+    for field in _UPDATABLE_STRING_FIELDS:
         if field in data:
-            value = data[field]
+            value = clean_str(data[field])
             
             # === VALIDAÇÃO DE NÃO VAZIO ===
-            if not is_valid_string(value):
+            if not value:
                 return jsonify({'erro':f'O campo {field} não pode ser vazio'}), 400
             # === FIM DA VALIDAÇÃO ===
 
-            cleaned_value = value.strip()
-            
-            # Previne duplicidade de CPF/Email
-            if field == 'cpf' and cleaned_value != patient.cpf:
-                if Patient.query.filter_by(cpf=cleaned_value).first():
-                    return jsonify({'erro':'CPF já cadastrado'}), 400
-                patient.cpf = cleaned_value
-            elif field == 'email' and cleaned_value != patient.email:
-                if Patient.query.filter_by(email=cleaned_value).first():
-                    return jsonify({'erro':'Email já cadastrado'}), 400
-                patient.email = cleaned_value
-            # Atualiza outros campos
-            elif field != 'cpf' and field != 'email':
-                setattr(patient, field, cleaned_value)
+            # Duplicidade de CPF/Email é verificada pelas restrições UNIQUE no commit
+            setattr(patient, field, value)
     
     if data.get('data_nascimento'):
         # Data de Nascimento deve ser uma string não vazia para ser processada
-        if not is_valid_string(data['data_nascimento']):
+        data_nascimento = clean_str(data['data_nascimento'])
+        if not data_nascimento:
             return jsonify({'erro':'O campo data_nascimento não pode ser vazio'}), 400
 
         try:
-            patient.data_nascimento = parse_date(data['data_nascimento'].strip())
+            patient.data_nascimento = parse_date(data_nascimento)
         except:
             return jsonify({'erro':'data_nascimento formato ISO (YYYY-MM-DD) esperado'}), 400
             
     # Atualiza dados do responsável (não implementado aqui, mas os dados não devem ser vazios se fornecidos)
     # NOTE: O código original não tratava a atualização dos dados do responsável no PUT.
-    # Se precisar atualizar o responsável, a lógica de validação de 'is_valid_string' deve ser aplicada a cada campo de responsável antes de salvar.
+    # Se precisar atualizar o responsável, a validação com 'clean_str' deve ser aplicada a cada campo de responsável antes de salvar.
 
     # handle responsible removal only if patient adult
     if 'remove_responsavel' in data and data.get('remove_responsavel')==True:
         # A validação de menoridade deve ser feita APÓS a potencial atualização de data_nascimento
-        from datetime import date
-        age_after_update = (date.today() - patient.data_nascimento).days//365
-        
-        if age_after_update < 18:
+        if is_minor(patient.data_nascimento):
             return jsonify({'erro':'Não é possível remover responsável enquanto paciente for menor'}), 400
             
         patient.resp_cpf = None
@@ -174,16 +170,26 @@ def update_patient(patient_id):
         patient.resp_email = None
         patient.resp_telefone = None
         
-    db.session.commit()
-    return jsonify(patient.to_dict()), 200
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        erro = duplicate_patient_error(e)
+        if erro is None:
+            raise
+        return jsonify({'erro': erro}), 400
+    return write_response(patient, 200)
 
 @patients_bp.route('/<int:patient_id>', methods=['DELETE'])
 @auth_required
 def delete_patient(patient_id):
     from models.appointment_model import Appointment
-    patient = Patient.query.get_or_404(patient_id)
-    linked = Appointment.query.filter_by(paciente_id=patient.id).first()
-    if linked:
+    patient = db.session.get(Patient, patient_id)
+    if patient is None:
+        abort(404)
+    # só o id do primeiro atendimento vinculado (ou None), sem carregar o objeto
+    linked = db.session.query(Appointment.id).filter_by(paciente_id=patient.id).limit(1).scalar()
+    if linked is not None:
         return jsonify({'erro':'Paciente possui atendimentos vinculados e não pode ser removido'}), 400
     db.session.delete(patient)
     db.session.commit()
@@ -192,11 +198,15 @@ def delete_patient(patient_id):
 @patients_bp.route('/<int:patient_id>', methods=['GET'])
 @auth_required
 def get_patient(patient_id):
-    patient = Patient.query.get_or_404(patient_id)
-    return jsonify(patient.to_dict()), 200
+    patient = db.session.get(Patient, patient_id)
+    if patient is None:
+        abort(404)
+    return msgjsonify(PatientOut.from_model(patient)), 200
 
 @patients_bp.route('/', methods=['GET'])
 @auth_required
 def list_patients():
-    query = Patient.query.order_by(Patient.id)
-    return jsonify(paginate_query(query, lambda p: p.to_dict())), 200
\ No newline at end of file
+    cursor_cols = (Patient.id,)
+    query, serialize = select_fields(Patient.query, Patient, _LIST_FIELDS, cursor_cols)
+    query = query.order_by(Patient.id)
+    return msgjsonify(paginate_query(query, serialize or PatientOut.from_model, cursor_cols=cursor_cols)), 200
\ No newline at end of file
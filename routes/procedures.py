@@ -1,17 +1,30 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, abort
 from app import db
 from models.procedure_model import Procedure
 from models.appointment_model import AppointmentProcedure, Appointment
 from utils.jwt_util import auth_required
-from utils.pagination import paginate_query
-# import re # Não é necessário se usarmos apenas a função is_valid_string
+from utils.pagination import paginate_query, projectable_fields, select_fields
+from utils.json_util import msgjsonify, get_json_fast, write_response
+from schemas import ProcedureOut
+from utils.db_errors import unique_violation_field
+from sqlalchemy.exc import IntegrityError
+from utils.validation import clean_str
 
 procedures_bp = Blueprint('procedures_bp', __name__)
 
-# Função auxiliar para verificar se a string não está vazia (após strip)
-def is_valid_string(value):
-    """Retorna True se o valor for uma string não vazia (após strip), False caso contrário."""
-    return isinstance(value, str) and bool(value.strip())
+_REQUIRED_STRING_FIELDS = ('nome', 'descricao')
+_REQUIRED_VALUE_FIELDS = ('valor_plano', 'valor_particular')
+
+# Campos que, se presentes no PUT, não podem ser vazios
+_UPDATABLE_FIELDS = {
+    'nome': str,
+    'descricao': str,
+    'valor_plano': (int, float),
+    'valor_particular': (int, float)
+}
+
+# Colunas que podem ser pedidas em ?fields= na listagem
+_LIST_FIELDS = projectable_fields(Procedure, ProcedureOut)
 
 @procedures_bp.route('/', methods=['POST'])
 @auth_required
@@ -19,28 +32,24 @@ def create_procedure():
     if request.user.get('tipo') != 'admin':
         return jsonify({'erro':'Apenas admin pode criar procedimentos'}), 403
     
-    data = request.get_json() or {}
-    required_string_fields = ['nome','descricao']
-    required_value_fields = ['valor_plano','valor_particular']
+    data = get_json_fast()
 
     # === INÍCIO DA VALIDAÇÃO DE CAMPOS NÃO VAZIOS (String) ===
-    for f in required_string_fields:
-        value = data.get(f)
-        if not is_valid_string(value):
+    # clean_str já devolve a string com strip aplicado
+    cleaned = {}
+    for f in _REQUIRED_STRING_FIELDS:
+        cleaned[f] = clean_str(data.get(f))
+        if not cleaned[f]:
             return jsonify({'erro':f'Campo {f} é obrigatório e não pode ser vazio'}), 400
             
     # === VALIDAÇÃO DE CAMPOS OBRIGATÓRIOS (Numéricos) ===
-    for f in required_value_fields:
+    for f in _REQUIRED_VALUE_FIELDS:
         if data.get(f) is None:
             return jsonify({'erro':f'Campo {f} obrigatório'}), 400
             
-    # Aplica strip nas strings antes de usar
-    nome = data['nome'].strip()
-    descricao = data['descricao'].strip()
+    nome = cleaned['nome']
+    descricao = cleaned['descricao']
     
-    if Procedure.query.filter_by(nome=nome).first():
-        return jsonify({'erro':'Nome de procedimento já existe'}), 400
-        
     try:
         valor_plano = float(data['valor_plano'])
         valor_particular = float(data['valor_particular'])
@@ -55,8 +64,15 @@ def create_procedure():
     )
     
     db.session.add(proc)
-    db.session.commit()
-    return jsonify(proc.to_dict()), 201
+    # Nome duplicado é verificado pela restrição UNIQUE no commit
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if unique_violation_field(e, ('nome',)) is None:
+            raise
+        return jsonify({'erro':'Nome de procedimento já existe'}), 400
+    return write_response(proc, 201)
 
 @procedures_bp.route('/<int:proc_id>', methods=['PUT'])
 @auth_required
@@ -64,39 +80,31 @@ def update_procedure(proc_id):
     if request.user.get('tipo') != 'admin':
         return jsonify({'erro':'Apenas admin pode editar procedimentos'}), 403
         
-    proc = Procedure.query.get_or_404(proc_id)
-    data = request.get_json() or {}
+    proc = db.session.get(Procedure, proc_id)
+    if proc is None:
+        abort(404)
+    data = get_json_fast()
     
-    # Lista de campos que, se presentes, não podem ser vazios
-    fields_to_validate = {
-        'nome': str,
-        'descricao': str,
-        'valor_plano': (int, float),
-        'valor_particular': (int, float)
-    }
-
     # Validação do campo 'nome'
     if 'nome' in data and data['nome'] != proc.nome:
-        if not is_valid_string(data['nome']):
+        new_nome = clean_str(data['nome'])
+        if not new_nome:
             return jsonify({'erro':'O campo nome não pode ser vazio'}), 400
             
-        new_nome = data['nome'].strip()
-        
-        if Procedure.query.filter_by(nome=new_nome).first():
-            return jsonify({'erro':'Nome de procedimento já existe'}), 400
-            
+        # Nome duplicado é verificado pela restrição UNIQUE no commit
         proc.nome = new_nome
 
     # Validação dos demais campos
-    for field, expected_type in fields_to_validate.items():
+    for field, expected_type in _UPDATABLE_FIELDS.items():
         if field in data and field != 'nome': # 'nome' já foi tratado acima
             value = data[field]
             
             # Validação de não-vazio para strings
             if expected_type is str:
-                if not is_valid_string(value):
+                value = clean_str(value)
+                if not value:
                     return jsonify({'erro':f'O campo {field} não pode ser vazio'}), 400
-                setattr(proc, field, value.strip()) # Aplica strip e salva
+                setattr(proc, field, value) # Salva já com strip
                 
             # Validação de tipo para valores numéricos
             elif expected_type == (int, float):
@@ -110,8 +118,14 @@ def update_procedure(proc_id):
                 except (ValueError, TypeError):
                     return jsonify({'erro':f'O campo {field} deve ser um número válido'}), 400
                     
-    db.session.commit()
-    return jsonify(proc.to_dict()), 200
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if unique_violation_field(e, ('nome',)) is None:
+            raise
+        return jsonify({'erro':'Nome de procedimento já existe'}), 400
+    return write_response(proc, 200)
 
 @procedures_bp.route('/<int:proc_id>', methods=['DELETE'])
 @auth_required
@@ -120,11 +134,14 @@ def delete_procedure(proc_id):
         return jsonify({'erro':'Apenas admin pode remover procedimentos'}), 403
         
     # do not remove if used in atendimentos
-    used = AppointmentProcedure.query.filter_by(procedimento_id=proc_id).first()
-    if used:
+    # only the id of the first link (or None), no ORM object hydration
+    used = db.session.query(AppointmentProcedure.id).filter_by(procedimento_id=proc_id).limit(1).scalar()
+    if used is not None:
         return jsonify({'erro':'Procedimento já utilizado em atendimentos e não pode ser removido'}), 400
         
-    proc = Procedure.query.get_or_404(proc_id)
+    proc = db.session.get(Procedure, proc_id)
+    if proc is None:
+        abort(404)
     db.session.delete(proc)
     db.session.commit()
     return jsonify({'mensagem':'Procedimento removido'}), 200
@@ -132,11 +149,15 @@ def delete_procedure(proc_id):
 @procedures_bp.route('/<int:proc_id>', methods=['GET'])
 @auth_required
 def get_procedure(proc_id):
-    proc = Procedure.query.get_or_404(proc_id)
-    return jsonify(proc.to_dict()), 200
+    proc = db.session.get(Procedure, proc_id)
+    if proc is None:
+        abort(404)
+    return msgjsonify(ProcedureOut.from_model(proc)), 200
 
 @procedures_bp.route('/', methods=['GET'])
 @auth_required
 def list_procedures():
-    query = Procedure.query.order_by(Procedure.id)
-    return jsonify(paginate_query(query, lambda p: p.to_dict())), 200
\ No newline at end of file
+    cursor_cols = (Procedure.id,)
+    query, serialize = select_fields(Procedure.query, Procedure, _LIST_FIELDS, cursor_cols)
+    query = query.order_by(Procedure.id)
+    return msgjsonify(paginate_query(query, serialize or ProcedureOut.from_model, cursor_cols=cursor_cols)), 200
\ No newline at end of file
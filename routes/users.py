@@ -1,183 +1,258 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, abort
 from app import db
-from models.user_model import User
-from utils.jwt_util import auth_required, admin_required
+from models.user_model import User, hash_password, hash_passwords
+from models.appointment_model import Appointment
+from utils.jwt_util import auth_required, admin_required, current_user
 from utils.pagination import paginate_query
-import re # Adicionado para validação de espaços em branco
+from utils.validation import clean_str
+from utils.rate_limit import too_many_attempts
+from utils.user_cache import get_user_dict_by_email, forget_user
+from utils.json_util import ojsonify, get_json_fast, write_response
+from utils.db_errors import unique_violation_field
+from schemas import CreateUserBody
+from sqlalchemy import exists, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import raiseload, load_only
+import msgspec
 
 users_bp = Blueprint('users_bp', __name__)
 
-# Função auxiliar para verificar se a string não está vazia (após strip)
-def is_valid_string(value):
-    """Retorna True se o valor for uma string não vazia (após strip), False caso contrário."""
-    return isinstance(value, str) and bool(value.strip())
+_VALID_USER_TIPOS = frozenset(('admin', 'default'))
+
+# Tentativas de troca de senha por usuário por minuto
+_CHANGE_PASSWORD_LIMIT = 5
+
+# Máximo de usuários por chamada de POST /usuarios/bulk
+_BULK_MAX = 100
 
 @users_bp.route('/', methods=['GET'])
 @auth_required
+@admin_required
 def list_users():
-    # only admin
-    from flask import request
-    if request.user.get('tipo') != 'admin':
-        return jsonify({'erro':'Acesso negado'}), 403
-    query = User.query
-    return jsonify(paginate_query(query, lambda u: u.to_dict())), 200
+    # só as colunas do to_dict (senha_hash fica de fora); relacionamentos nunca são carregados
+    query = User.query.options(
+        load_only(User.id, User.email, User.nome, User.tipo), raiseload('*')
+    ).order_by(User.id)
+    return ojsonify(paginate_query(query, lambda u: u.to_dict(), cursor_cols=(User.id,))), 200
 
 @users_bp.route('/', methods=['POST'])
 @auth_required
+@admin_required
 def create_user():
-
-    from flask import request
-    # only admin can create
-    if request.user.get('tipo') != 'admin':
-        return jsonify({'erro':'Apenas admin pode cadastrar usuários'}), 403
-        
-    data = request.get_json() or {}
+    # Presença e tipos (strings) de email, nome e senha são validados pelo msgspec
+    try:
+        body = msgspec.json.decode(request.get_data(), type=CreateUserBody)
+    except msgspec.DecodeError as e:
+        return ojsonify({'erro':f'Dados inválidos: {e}'}), 400
     
-    email = data.get('email')
-    nome = data.get('nome')
-    tipo = data.get('tipo', 'default')
-    senha = data.get('senha')
+    # Normaliza os campos para remover espaços antes/depois, garantindo que o valor seja salvo corretamente
+    email = clean_str(body.email)
+    nome = clean_str(body.nome)
+    tipo = clean_str(body.tipo)
+    senha = clean_str(body.senha)
     
     # === INÍCIO DA VALIDAÇÃO DE CAMPOS NÃO VAZIOS ===
     # A validação agora exige que os campos sejam preenchidos E não contenham apenas espaços em branco.
-    if not all([is_valid_string(email), is_valid_string(nome), is_valid_string(tipo), is_valid_string(senha)]):
-        return jsonify({'erro':'email, nome, tipo, e senha são obrigatórios e não podem ser vazios'}), 400
+    if not all([email, nome, tipo, senha]):
+        return ojsonify({'erro':'email, nome, tipo, e senha são obrigatórios e não podem ser vazios'}), 400
     # === FIM DA VALIDAÇÃO DE CAMPOS NÃO VAZIOS ===
     
-    # Normaliza os campos para remover espaços antes/depois, garantindo que o valor seja salvo corretamente
-    email = email.strip()
-    nome = nome.strip()
-    tipo = tipo.strip()
-    senha = senha.strip()
-    
-    if tipo not in ['admin','default']:
-        return jsonify({'erro':'tipo inválido'}), 400
-        
-    if User.query.filter_by(email=email).first():
-        return jsonify({'erro':'email já cadastrado'}), 400
+    if tipo not in _VALID_USER_TIPOS:
+        return ojsonify({'erro':'tipo inválido'}), 400
         
     user = User(email=email, nome=nome, tipo=tipo)
     user.set_password(senha)
     db.session.add(user)
-    db.session.commit()
-    return jsonify(user.to_dict()), 201
+    # Email duplicado é verificado pela restrição UNIQUE no commit
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if unique_violation_field(e, ('email',)) is None:
+            raise
+        return ojsonify({'erro':'email já cadastrado'}), 400
+    return write_response(user, 201)
+
+@users_bp.route('/bulk', methods=['POST'])
+@auth_required
+@admin_required
+def create_users_bulk():
+    items = get_json_fast()
+    if not isinstance(items, list) or not items:
+        return ojsonify({'erro':'Envie uma lista de usuários'}), 400
+    if len(items) > _BULK_MAX:
+        return ojsonify({'erro':f'Máximo de {_BULK_MAX} usuários por requisição'}), 400
+
+    # valida tudo antes de gastar CPU com os hashes
+    rows = []
+    senhas = []
+    emails = set()
+    for i, data in enumerate(items):
+        if not isinstance(data, dict):
+            return ojsonify({'erro':f'Usuário {i}: formato inválido'}), 400
+        email = clean_str(data.get('email'))
+        nome = clean_str(data.get('nome'))
+        tipo = clean_str(data.get('tipo', 'default'))
+        senha = clean_str(data.get('senha'))
+        if not all([email, nome, tipo, senha]):
+            return ojsonify({'erro':f'Usuário {i}: email, nome, tipo, e senha são obrigatórios e não podem ser vazios'}), 400
+        if tipo not in _VALID_USER_TIPOS:
+            return ojsonify({'erro':f'Usuário {i}: tipo inválido'}), 400
+        if email in emails:
+            return ojsonify({'erro':f'Usuário {i}: email repetido na lista'}), 400
+        emails.add(email)
+        rows.append({'email': email, 'nome': nome, 'tipo': tipo})
+        senhas.append(senha)
+
+    # O KDF domina o custo: os hashes rodam em paralelo (ver hash_passwords)
+    for row, senha_hash in zip(rows, hash_passwords(senhas)):
+        row['senha_hash'] = senha_hash
+
+    # Um único INSERT multi-linha. O RETURNING não garante a ordem das linhas, então
+    # os ids são casados pelo email (único) para voltar na ordem da lista enviada.
+    # Email já cadastrado é verificado pela restrição UNIQUE.
+    try:
+        id_by_email = dict(db.session.execute(
+            insert(User).returning(User.email, User.id), rows
+        ).all())
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if unique_violation_field(e, ('email',)) is None:
+            raise
+        return ojsonify({'erro':'email já cadastrado'}), 400
+    return ojsonify({'ids': [id_by_email[row['email']] for row in rows]}), 201
 
 @users_bp.route('/<int:user_id>', methods=['PUT'])
 @auth_required
 def update_user(user_id):
-    from flask import request
-    data = request.get_json() or {}
-    user = User.query.get_or_404(user_id)
-    
     # only admin or the user themself can edit
-    if request.user.get('tipo') != 'admin' and request.user.get('id') != user.id:
-        return jsonify({'erro':'Permitido apenas editar próprio usuário ou admin'}), 403
-        
+    if request.user.get('tipo') != 'admin' and request.user.get('id') != user_id:
+        return ojsonify({'erro':'Permitido apenas editar próprio usuário ou admin'}), 403
+
+    data = get_json_fast()
     nome = data.get('nome')
     email = data.get('email')
+    changes = {}
     
     # Validação para o campo 'email' no PUT:
     if email is not None:
-        if not is_valid_string(email):
-            return jsonify({'erro':'O campo email não pode ser vazio'}), 400
-        
         # Normaliza o valor para uso
-        email = email.strip()
-        
-        if email != user.email:
-            if User.query.filter_by(email=email).first():
-                return jsonify({'erro':'email já cadastrado'}), 400
-            user.email = email
+        email = clean_str(email)
+        if not email:
+            return ojsonify({'erro':'O campo email não pode ser vazio'}), 400
+        changes['email'] = email
             
     # Validação para o campo 'nome' no PUT:
     if nome is not None:
-        if not is_valid_string(nome):
-            return jsonify({'erro':'O campo nome não pode ser vazio'}), 400
-            
-        # Normaliza e atualiza
-        user.nome = nome.strip()
-        
-    db.session.commit()
-    return jsonify(user.to_dict()), 200
+        nome = clean_str(nome)
+        if not nome:
+            return ojsonify({'erro':'O campo nome não pode ser vazio'}), 400
+        changes['nome'] = nome
+
+    if not changes:
+        user = db.session.get(User, user_id)
+        if user is None:
+            abort(404)
+        return write_response(user, 200)
+
+    # Um único UPDATE ... RETURNING: sem SELECT prévio nem flush do unit-of-work.
+    # Email duplicado é verificado pela restrição UNIQUE.
+    try:
+        user = db.session.execute(
+            update(User).where(User.id == user_id).values(**changes).returning(User)
+        ).scalar_one_or_none()
+        if user is None:
+            abort(404)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if unique_violation_field(e, ('email',)) is None:
+            raise
+        return ojsonify({'erro':'email já cadastrado'}), 400
+    forget_user(user_id)
+    return write_response(user, 200)
 
 @users_bp.route('/<int:user_id>', methods=['DELETE'])
 @auth_required
+@admin_required
 def delete_user(user_id):
-    from models.appointment_model import Appointment
-    user = User.query.get_or_404(user_id)
-    # only admin can delete and only if no atendimentos
-    if request.user.get('tipo') != 'admin':
-        return jsonify({'erro':'Apenas admin pode remover usuários'}), 403
-    linked = Appointment.query.filter_by(usuario_id=user.id).first()
-    if linked:
-        return jsonify({'erro':'Usuário possui atendimentos vinculados e não pode ser removido'}), 400
-    db.session.delete(user)
+    # only if no atendimentos; usuário e existência de atendimentos numa única consulta
+    row = db.session.query(
+        User, exists().where(Appointment.usuario_id == User.id).label('has_appt')
+    ).filter(User.id == user_id).first()
+    if row is None:
+        abort(404)
+    if row.has_appt:
+        return ojsonify({'erro':'Usuário possui atendimentos vinculados e não pode ser removido'}), 400
+    db.session.delete(row.User)
     db.session.commit()
-    return jsonify({'mensagem':'Usuário removido'}), 200
+    forget_user(user_id)
+    return ojsonify({'mensagem':'Usuário removido'}), 200
 
 @users_bp.route('/<int:user_id>/reset-senha', methods=['POST'])
 @auth_required
+@admin_required
 def reset_password(user_id):
-    # only admin can reset passwords
-    if request.user.get('tipo') != 'admin':
-        return jsonify({'erro':'Apenas admin pode resetar senhas'}), 403
-        
-    data = request.get_json() or {}
-    new = data.get('senha')
+    data = get_json_fast()
+    new = clean_str(data.get('senha'))
     
     # === VALIDAÇÃO DE SENHA NOVA NÃO VAZIA ===
-    if not is_valid_string(new):
-        return jsonify({'erro':'senha nova obrigatória e não pode ser vazia'}), 400
+    if not new:
+        return ojsonify({'erro':'senha nova obrigatória e não pode ser vazia'}), 400
     # === FIM DA VALIDAÇÃO ===
     
-    user = User.query.get_or_404(user_id)
-    user.set_password(new.strip())
+    # UPDATE direto: não precisa carregar o usuário só para trocar o hash
+    updated = User.query.filter_by(id=user_id).update(
+        {'senha_hash': hash_password(new)}, synchronize_session=False
+    )
+    if not updated:
+        abort(404)
     db.session.commit()
-    return jsonify({'mensagem':'Senha resetada'}), 200
+    return ojsonify({'mensagem':'Senha resetada'}), 200
 
 @users_bp.route('/me/alterar-senha', methods=['POST'])
 @auth_required
 def change_password():
-    from flask import request
-    data = request.get_json() or {}
-    old = data.get('senha_antiga')
-    new = data.get('senha_nova')
+    # a verificação da senha antiga é o custo dominante (KDF); limita por usuário
+    if too_many_attempts(('alterar-senha', request.user.get('id')), _CHANGE_PASSWORD_LIMIT):
+        return ojsonify({'erro':'Muitas tentativas, aguarde um minuto'}), 429
+    data = get_json_fast()
+    old = clean_str(data.get('senha_antiga'))
+    new = clean_str(data.get('senha_nova'))
     
     # === VALIDAÇÃO DE SENHAS NÃO VAZIAS ===
-    if not all([is_valid_string(old), is_valid_string(new)]):
-        return jsonify({'erro':'senha_antiga e senha_nova obrigatórias e não podem ser vazias'}), 400
+    if not all([old, new]):
+        return ojsonify({'erro':'senha_antiga e senha_nova obrigatórias e não podem ser vazias'}), 400
     # === FIM DA VALIDAÇÃO ===
     
-    old = old.strip()
-    new = new.strip()
-    
-    user = User.query.get_or_404(request.user.get('id'))
-    if not user.check_password(old):
-        return jsonify({'erro':'senha antiga incorreta'}), 400
+    user = current_user()
+    if user is None:
+        abort(404)
+    # a senha antiga é substituída logo abaixo: regravar o hash dela seria um KDF a mais
+    if not user.check_password(old, rehash=False):
+        return ojsonify({'erro':'senha antiga incorreta'}), 400
         
     user.set_password(new)
     db.session.commit()
-    return jsonify({'mensagem':'Senha alterada'}), 200
+    return ojsonify({'mensagem':'Senha alterada'}), 200
 
 @users_bp.route('/buscar', methods=['GET'])
 @auth_required
 def get_by_email():
-    from flask import request
-    email = request.args.get('email')
+    email = clean_str(request.args.get('email'))
     
     # === VALIDAÇÃO DE EMAIL NÃO VAZIO ===
-    if not is_valid_string(email):
-        return jsonify({'erro':'email é obrigatório e não pode ser vazio'}), 400
+    if not email:
+        return ojsonify({'erro':'email é obrigatório e não pode ser vazio'}), 400
     # === FIM DA VALIDAÇÃO ===
     
-    email = email.strip()
-    
-    user = User.query.filter_by(email=email).first()
+    user = get_user_dict_by_email(email)
     if not user:
-        return jsonify({'erro':'Usuário não encontrado'}), 404
+        return ojsonify({'erro':'Usuário não encontrado'}), 404
         
-    # only admin or own user
-    if request.user.get('tipo') != 'admin' and request.user.get('id') != user.id:
-        return jsonify({'erro':'Acesso negado'}), 403
+    # only admin or own user (também quando vem do cache)
+    if request.user.get('tipo') != 'admin' and request.user.get('id') != user['id']:
+        return ojsonify({'erro':'Acesso negado'}), 403
         
-    return jsonify(user.to_dict()), 200
\ No newline at end of file
+    return ojsonify(user), 200
\ No newline at end of file
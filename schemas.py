@@ -0,0 +1,118 @@
+import msgspec
+from datetime import datetime, date
+from typing import Optional, Literal
+
+# Corpos de requisição: decodificados direto dos bytes com msgspec.json.decode
+# (parse + validação de tipos numa única passada em C, sem dict intermediário).
+# Use strict=False para aceitar IDs numéricos enviados como string.
+
+class CreateAppointmentReq(msgspec.Struct):
+    data_hora: str  # validado com ciso8601 na rota (aceita também só a data)
+    paciente_id: int
+    procedimentos: list[int]
+    tipo: Literal['plano', 'particular']
+    numero_carteira: Optional[str] = None
+
+class CreateUserBody(msgspec.Struct):
+    email: str
+    nome: str
+    senha: str
+    tipo: str = 'default'  # espaços nas pontas são aceitos; validado na rota após o strip
+
+# Espelhos de saída (response) dos models. São montados direto dos atributos do
+# objeto e codificados com msgspec.json.encode, sem passar por um dict intermediário.
+
+class ProcedureOut(msgspec.Struct):
+    id: int
+    nome: str
+    descricao: str
+    valor_plano: float
+    valor_particular: float
+
+    @classmethod
+    def from_model(cls, p):
+        return cls(
+            id=p.id,
+            nome=p.nome,
+            descricao=p.descricao,
+            valor_plano=p.valor_plano,
+            valor_particular=p.valor_particular
+        )
+
+class AppointmentOut(msgspec.Struct):
+    id: int
+    data_hora: datetime
+    tipo: str
+    numero_carteira: Optional[str]
+    valor_total: float
+    usuario_id: int
+    paciente_id: int
+    procedimentos: list[ProcedureOut]
+
+    @classmethod
+    def from_model(cls, a):
+        return cls(
+            id=a.id,
+            data_hora=a.data_hora,
+            tipo=a.tipo,
+            numero_carteira=a.numero_carteira,
+            valor_total=a.valor_total,
+            usuario_id=a.usuario_id,
+            paciente_id=a.paciente_id,
+            procedimentos=[ProcedureOut.from_model(ap.procedimento) for ap in a.procedimentos]
+        )
+
+class EnderecoOut(msgspec.Struct):
+    estado: str
+    cidade: str
+    bairro: str
+    cep: str
+    rua: str
+    numero: str
+
+class ResponsavelOut(msgspec.Struct):
+    cpf: Optional[str]
+    nome: Optional[str]
+    data_nascimento: Optional[date]
+    email: Optional[str]
+    telefone: Optional[str]
+
+# omit_defaults: 'responsavel' só aparece para pacientes menores, como no to_dict()
+class PatientOut(msgspec.Struct, omit_defaults=True):
+    id: int
+    cpf: str
+    nome: str
+    email: str
+    telefone: str
+    data_nascimento: date
+    endereco: EnderecoOut
+    responsavel: Optional[ResponsavelOut] = None
+
+    @classmethod
+    def from_model(cls, p):
+        responsavel = None
+        if p.is_minor():
+            responsavel = ResponsavelOut(
+                cpf=p.resp_cpf,
+                nome=p.resp_nome,
+                data_nascimento=p.resp_data_nascimento,
+                email=p.resp_email,
+                telefone=p.resp_telefone
+            )
+        return cls(
+            id=p.id,
+            cpf=p.cpf,
+            nome=p.nome,
+            email=p.email,
+            telefone=p.telefone,
+            data_nascimento=p.data_nascimento,
+            endereco=EnderecoOut(
+                estado=p.estado,
+                cidade=p.cidade,
+                bairro=p.bairro,
+                cep=p.cep,
+                rua=p.rua,
+                numero=p.numero
+            ),
+            responsavel=responsavel
+        )
@@ -0,0 +1,14 @@
+def unique_violation_field(err, fields):
+    """Retorna qual dos campos causou a violação UNIQUE de um IntegrityError (ou None).
+
+    Usa o nome da constraint quando o driver informa (Postgres: e.orig.diag) e cai
+    para a mensagem do banco no SQLite ("UNIQUE constraint failed: tabela.campo").
+    """
+    diag = getattr(err.orig, 'diag', None)
+    constraint = getattr(diag, 'constraint_name', None)
+    if constraint:
+        # a mensagem do Postgres traz o valor duplicado no DETAIL (ex.: um email
+        # "joao.cpf@x.com"), então com o nome da constraint ela não é consultada
+        return next((f for f in fields if f'_{f}_' in constraint), None)
+    message = str(err.orig)
+    return next((f for f in fields if f'.{f}' in message), None)
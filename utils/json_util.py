@@ -0,0 +1,26 @@
+import orjson
+import msgspec
+from flask import current_app, request, abort
+
+def ojsonify(obj):
+    """Equivalente ao jsonify, mas serializa com orjson (bem mais rápido em listagens grandes)."""
+    return current_app.response_class(orjson.dumps(obj), mimetype='application/json')
+
+def msgjsonify(obj):
+    """Serializa com msgspec; aceita Structs (schemas.py) aninhados em dicts/listas."""
+    return current_app.response_class(msgspec.json.encode(obj), mimetype='application/json')
+
+def get_json_fast():
+    """Substitui request.get_json() or {}: faz o parse do corpo com orjson."""
+    if not request.content_length:
+        return {}
+    try:
+        return orjson.loads(request.get_data()) or {}
+    except orjson.JSONDecodeError:
+        abort(400)
+
+def write_response(obj, status):
+    """Resposta de POST/PUT: só {'id': ...}. Com ?full=1 devolve o objeto completo (transição)."""
+    if request.args.get('full') == '1':
+        return ojsonify(obj.to_dict()), status
+    return ojsonify({'id': obj.id}), status
@@ -1,9 +1,35 @@
 import jwt
-from flask import request, jsonify
+import time
+import hashlib
+import threading
+from cachetools import TTLCache
+from flask import request, jsonify, g
 from functools import wraps
 from config import Config
+from app import db
+from models.user_model import User
 from datetime import datetime, timedelta
 
+# Payloads de tokens já verificados, por sha256 do token. Só tokens válidos e com
+# 'exp' entram; o 'exp' é conferido a cada uso, então a entrada nunca sobrevive ao
+# próprio token. Tokens sem 'exp' são verificados a cada requisição.
+_token_cache = TTLCache(maxsize=10000, ttl=30)
+_token_lock = threading.Lock()
+
+def decode_token(token):
+    """jwt.decode com cache; propaga as mesmas exceções do PyJWT. Devolve sempre uma
+    cópia do payload, então quem chama pode alterá-la sem afetar outras requisições."""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    with _token_lock:
+        payload = _token_cache.get(key)
+    if payload is not None and payload['exp'] > time.time():
+        return dict(payload)
+    payload = jwt.decode(token, Config.JWT_SECRET, algorithms=['HS256'])
+    if isinstance(payload.get('exp'), (int, float)):
+        with _token_lock:
+            _token_cache[key] = payload
+    return dict(payload)
+
 def generate_token(user_id, tipo):
     payload = {
         'id': user_id,
@@ -23,24 +49,29 @@ def auth_required(fn):
             return jsonify({'erro':'Cabeçalho Authorization inválido'}), 401
         token = parts[1]
         try:
-            payload = jwt.decode(token, Config.JWT_SECRET, algorithms=['HS256'])
+            payload = decode_token(token)
         except jwt.ExpiredSignatureError:
             return jsonify({'erro':'Token expirado'}), 401
         except Exception:
             return jsonify({'erro':'Token inválido'}), 401
         # attach user info to request context (flask global)
         request.user = payload
+        g.current_user_id = payload.get('id')
+        g.is_admin = payload.get('tipo') == 'admin'
         return fn(*args, **kwargs)
     return wrapper
 
+def current_user():
+    """Usuário autenticado (ou None se foi removido), carregado uma vez por requisição."""
+    if 'current_user_obj' not in g:
+        g.current_user_obj = db.session.get(User, g.current_user_id)
+    return g.current_user_obj
+
 def admin_required(fn):
+    """Usar abaixo de @auth_required, que define g.is_admin."""
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        # ensure authenticated first
-        if not hasattr(request, 'user'):
-            # try to run auth_required
-            return auth_required(lambda *a, **k: fn(*a, **k))()
-        if request.user.get('tipo') != 'admin':
+        if not g.get('is_admin'):
             return jsonify({'erro':'Acesso de administrador necessário'}), 403
         return fn(*args, **kwargs)
     return wrapper
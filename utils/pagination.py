@@ -1,5 +1,77 @@
-from flask import request
-def paginate_query(query, schema_item_to_dict):
+import base64
+import orjson
+import ciso8601
+from datetime import datetime
+from flask import request, current_app
+from sqlalchemy import tuple_
+from sqlalchemy.orm import raiseload, load_only
+
+# Teto do ?tamanho=: uma página nunca materializa mais que isso de linhas
+MAX_TAMANHO = 100
+
+def strict_loading_enabled():
+    return current_app.config.get('DEBUG') or current_app.config.get('STRICT_LOADING')
+
+def encode_cursor(values):
+    raw = orjson.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _cursor_value(col, v):
+    """Converte um valor do cursor para o tipo da coluna; ValueError se não bater."""
+    py_type = col.type.python_type
+    if py_type is datetime:
+        if not isinstance(v, str):
+            raise ValueError(v)
+        return ciso8601.parse_datetime(v)
+    # bool é subclasse de int, mas true/false não é um id válido
+    if isinstance(v, bool) and py_type is not bool:
+        raise ValueError(v)
+    if py_type is float and isinstance(v, int):
+        return float(v)
+    if not isinstance(v, py_type):
+        raise ValueError(v)
+    return v
+
+def decode_cursor(cursor, cursor_cols):
+    """Retorna os valores do cursor na ordem de cursor_cols, ou None se o cursor for inválido
+    (inclusive se algum valor não for do tipo da coluna correspondente)."""
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor))
+        if not isinstance(values, list) or len(values) != len(cursor_cols):
+            return None
+        return [_cursor_value(col, v) for col, v in zip(cursor_cols, values)]
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+def projectable_fields(model, out_struct):
+    """Campos do DTO que são colunas simples do model (os que podem ser pedidos em ?fields=)."""
+    return frozenset(out_struct.__struct_fields__) & frozenset(model.__table__.columns.keys())
+
+def select_fields(query, model, allowed, cursor_cols=()):
+    """Aplica ?fields=id,data_hora: busca só essas colunas (mais as do cursor) e devolve
+    (query, serializador). Sem fields válidos devolve (query, None) e a rota usa o DTO completo."""
+    raw = request.args.get('fields')
+    fields = [f for f in dict.fromkeys(f.strip() for f in raw.split(',')) if f in allowed] if raw else []
+    if not fields:
+        return query, None
+    cols = dict.fromkeys([*fields, *(col.key for col in cursor_cols)])
+    query = query.options(load_only(*(getattr(model, c) for c in cols)))
+    return query, lambda obj: {f: getattr(obj, f) for f in fields}
+
+def count_rows(query):
+    """Total de linhas da query. No PostgreSQL é sempre a estimativa do planner
+    ('Plan Rows' do EXPLAIN, sem varrer a tabela), portanto aproximado. Nos outros
+    bancos, COUNT(*) exato."""
+    dialect = query.session.get_bind().dialect
+    if dialect.name != 'postgresql':
+        return query.count()
+    compiled = query.statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    plan = query.session.connection().exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + compiled.string, compiled.params
+    ).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def _page_params():
     try:
         pagina = int(request.args.get('pagina', 1))
         tamanho = int(request.args.get('tamanho', 10))
@@ -8,7 +80,48 @@ def paginate_query(query, schema_item_to_dict):
         tamanho = 10
     if pagina < 1: pagina = 1
     if tamanho < 1: tamanho = 10
-    total = query.count()
+    if tamanho > MAX_TAMANHO: tamanho = MAX_TAMANHO
+    return pagina, tamanho
+
+def _after_cursor(query, cursor, cursor_cols):
+    # cursor vazio ou inválido recomeça do início (como pagina inválida volta para 1)
+    values = decode_cursor(cursor, cursor_cols) if cursor else None
+    if values is None:
+        return query
+    if len(cursor_cols) == 1:
+        return query.filter(cursor_cols[0] > values[0])
+    return query.filter(tuple_(*cursor_cols) > tuple_(*values))
+
+# Rotas de listagem devem declarar explicitamente (selectinload/joinedload) os
+# relacionamentos usados no serializer. Em DEBUG ou com STRICT_LOADING=1, qualquer
+# outro relacionamento acessado gera erro em vez de um N+1 silencioso.
+#
+# Se a rota informar cursor_cols (as mesmas colunas do order_by, terminando na PK),
+# o cliente pode paginar por ?cursor=... (keyset): cada página custa O(tamanho) no
+# banco, independente da profundidade, e não há COUNT(*). Sem cursor, mantém o
+# formato antigo com ?pagina=&tamanho= (OFFSET/LIMIT).
+def paginate_query(query, schema_item_to_dict, cursor_cols=None):
+    pagina, tamanho = _page_params()
+    if strict_loading_enabled():
+        query = query.options(raiseload('*'))
+
+    cursor = request.args.get('cursor')
+    if cursor_cols and cursor is not None:
+        query = _after_cursor(query, cursor, cursor_cols)
+        # busca um item a mais só para saber se existe próxima página
+        items = query.limit(tamanho + 1).all()
+        proximo_cursor = None
+        if len(items) > tamanho:
+            items = items[:tamanho]
+            last = items[-1]
+            proximo_cursor = encode_cursor([getattr(last, col.key) for col in cursor_cols])
+        return {
+            'dados': [schema_item_to_dict(i) for i in items],
+            'tamanho': tamanho,
+            'proximo_cursor': proximo_cursor
+        }
+
+    total = count_rows(query)
     items = query.offset((pagina-1)*tamanho).limit(tamanho).all()
     dados = [schema_item_to_dict(i) for i in items]
     paginas = (total + tamanho - 1) // tamanho
@@ -0,0 +1,16 @@
+import threading
+from cachetools import TTLCache
+
+# Contadores de tentativas por chave, em janelas fixas de 60s contadas da primeira
+# tentativa. Local ao processo, como os demais caches: com N workers o limite
+# efetivo chega a N vezes o configurado.
+_hits = TTLCache(maxsize=10000, ttl=60)
+_lock = threading.Lock()
+
+def too_many_attempts(key, limit):
+    """Registra uma tentativa para key e retorna True se passou de limit na janela."""
+    with _lock:
+        # a lista é alterada no lugar para não renovar o TTL da entrada
+        hits = _hits.setdefault(key, [0])
+        hits[0] += 1
+        return hits[0] > limit
@@ -0,0 +1,33 @@
+import threading
+from cachetools import TTLCache
+from sqlalchemy.orm import raiseload
+from models.user_model import User
+
+# to_dict() dos usuários buscados por email em /usuarios/buscar. Só usuários
+# encontrados entram (um email ainda não cadastrado nunca fica "preso" como
+# inexistente). update_user e delete_user chamam forget_user() após o commit.
+# Cache local ao processo: forget_user() só limpa o worker que atendeu a escrita;
+# os outros podem devolver o dado antigo por até USER_CACHE_TTL segundos.
+USER_CACHE_TTL = 5
+_user_cache = TTLCache(maxsize=4096, ttl=USER_CACHE_TTL)
+_lock = threading.Lock()
+
+def get_user_dict_by_email(email):
+    """Retorna o to_dict() do usuário com esse email, ou None se não existir."""
+    with _lock:
+        cached = _user_cache.get(email)
+    if cached is not None:
+        return cached
+    user = User.query.options(raiseload('*')).filter_by(email=email).first()
+    if user is None:
+        return None
+    data = user.to_dict()
+    with _lock:
+        _user_cache[email] = data
+    return data
+
+def forget_user(user_id):
+    """Remove o usuário do cache, seja qual for o email com que foi guardado."""
+    with _lock:
+        for email in [e for e, u in _user_cache.items() if u['id'] == user_id]:
+            del _user_cache[email]
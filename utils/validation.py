@@ -0,0 +1,24 @@
+import re
+import ciso8601
+
+# Primeiro caractere não-espaço; para no primeiro que encontrar
+_NON_WS = re.compile(r'\S').search
+
+def clean_str(value):
+    """Retorna a string sem espaços nas pontas, ou None se não for string ou só tiver espaços.
+
+    Substitui o par is_valid_string(v) + v.strip(): valida e normaliza com um único strip.
+    """
+    if isinstance(value, str) and _NON_WS(value) is not None:
+        return value.strip()
+    return None
+
+def parse_iso_datetime(value):
+    """ciso8601.parse_datetime restrito a datas completas (YYYY-MM-DD, com ou sem hora).
+
+    O ciso8601 também aceita datas parciais ('2024-01' vira o dia 1), que o
+    datetime.fromisoformat recusava; elas continuam dando ValueError.
+    """
+    if len(value) < 10:
+        raise ValueError(f'data incompleta: {value!r}')
+    return ciso8601.parse_datetime(value)